@@ -32,6 +32,11 @@ Attributes:
         importlib (if you're reading this and know a better way, please email me).
     LOG_LEVEL (int): The level of logs which are to be displayed. See the log method in this module.
     COLORS_ENABLED (bool): If the console log colors are to be enabled or disabled.
+    PROFILE_DIR (str): The folder in which the profile command writes its .prof and collapsed-stack files.
+    PROFILE_TOP (int): The number of functions and allocation sites printed by the profile command.
+    SAMPLE_INTERVAL (float): The number of seconds between the stack samples taken by the profile command.
+    PROFILES (dict): Maps each profiled command to the cumulative time of each function in its last profile, so that
+        runs before and after a module is reloaded can be compared.
 
 Todo:
     * Separate launched module to separate process and console to allow for use of both modules synchronously.
@@ -39,8 +44,16 @@ Todo:
 
 """
 
+import builtins
+import cProfile
+import collections
 import importlib
 import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
 
 
 def launch_module(*args: tuple):
@@ -190,6 +203,188 @@ def info():
         print()
 
 
+def run_command(i: list):
+    """Runs a command as typed into the shell.
+
+    Args:
+        i: The command name followed by its arguments.
+
+    Returns:
+        None
+    """
+    if not COMMANDS.get(i[0]):
+        log(2, "Command \"", i[0], "\" does not exist or is misspelled", sep='')
+    elif (COMMANDS.get(i[0])[1] != len(i) - 1) and (COMMANDS.get(i[0])[1] != -1):
+        log(2, "Invalid number of args for command ", i[0],
+            "(defined: ", COMMANDS.get(i[0])[1], ", passed: ", len(i) - 1, ")", sep="")
+    elif len(i) == 1:
+        COMMANDS[i[0]][0]()
+    else:
+        COMMANDS[i[0]][0](i[1:])
+
+
+def sample_stacks(samples: collections.Counter, stop: threading.Event, peak: dict=None):
+    """Samples the stacks of every other thread until stopped.
+
+    Each stack is counted as one line of the collapsed format read by flamegraph tools, rooted at its thread's name.
+    When tracemalloc is tracing, the traced allocations are also snapshotted each time they grow 10% past the last
+    snapshot, so that the allocation sites reported are those of the peak rather than of whatever is left at the end.
+
+    Args:
+        samples: Counts each sampled stack.
+        stop: Set when sampling should end.
+        peak: Holds the "size" of traced memory at the latest "snapshot", if memory is being traced.
+
+    Returns:
+        None
+    """
+    me = threading.get_ident()
+    while not stop.wait(SAMPLE_INTERVAL):
+        if peak is not None:
+            snapshot_peak(peak)
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame:
+                stack.append(os.path.basename(frame.f_code.co_filename) + ":" + frame.f_code.co_name)
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            samples[";".join(reversed(stack))] += 1
+
+
+def snapshot_peak(peak: dict, step: float=1.1):
+    """Snapshots the traced allocations if traced memory has grown by step since the last snapshot.
+
+    Args:
+        peak: Holds the "size" of traced memory at the latest "snapshot".
+        step: The growth factor which triggers a new snapshot.
+
+    Returns:
+        None
+    """
+    current = tracemalloc.get_traced_memory()[0]
+    if peak["snapshot"] is None or current > peak["size"] * step:
+        peak["snapshot"] = tracemalloc.take_snapshot()
+        peak["size"] = current
+
+
+def profile_command(*args: tuple):
+    """Runs a command under cProfile and tracemalloc and reports where its time and memory went.
+
+    Usage is "profile [-t seconds] [-cpu | -mem] <command> [args]". Once the optional duration has elapsed every
+    prompt the command reads from the console is answered with "q", so that interactive commands such as start_server
+    can be profiled for a fixed time. cProfile only sees the shell's thread, while the stack samples written to the
+    collapsed-stack file and the allocations traced by tracemalloc cover every thread. Allocation sites are reported from
+    the snapshot taken closest to the traced peak, leaving out the profiler's own. Functions are compared with the
+    last profile of the same command by file and name, which remain stable when a module is reloaded.
+
+    Args:
+        *args: The options, followed by the command to profile and its arguments.
+
+    Returns:
+        None
+    """
+    args = list(args[0]) if args else input("What to profile? ").strip().split()
+    duration = None
+    cpu = mem = True
+    while args and args[0].startswith("-"):
+        flag = args.pop(0)
+        if flag == "-t":
+            if not args:
+                log(0, "Option -t needs a duration in seconds")
+                return
+            try:
+                duration = float(args.pop(0))
+            except ValueError:
+                log(0, "Duration must be a number of seconds")
+                return
+        elif flag == "-cpu":
+            mem = False
+        elif flag == "-mem":
+            cpu = False
+        else:
+            log(0, "Unknown profile option", flag)
+            return
+    if not args:
+        log(0, "No command to profile")
+        return
+    if not COMMANDS.get(args[0]) or args[0] == "profile":
+        log(0, "Command \"", args[0], "\" cannot be profiled", sep='')
+        return
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = base = os.path.join(PROFILE_DIR, args[0] + "-" + time.strftime("%Y%m%d-%H%M%S"))
+    run = 1
+    while os.path.exists(path + ".collapsed"):
+        run += 1
+        path = base + "-" + str(run)
+    console_input = builtins.input
+    if duration is not None:
+        deadline = time.time() + duration
+
+        def timed_input(prompt=""):
+            time.sleep(max(0.0, deadline - time.time()))
+            return "q"
+        builtins.input = timed_input
+
+    samples = collections.Counter()
+    stop = threading.Event()
+    peak = {"size": 0, "snapshot": None} if mem else None
+    sampler = threading.Thread(target=sample_stacks, args=(samples, stop, peak), daemon=True)
+    profiler = cProfile.Profile() if cpu else None
+    if mem:
+        tracemalloc.start()
+    sampler.start()
+    start = time.perf_counter()
+    try:
+        if profiler:
+            profiler.enable()
+        run_command(args)
+    finally:
+        if profiler:
+            profiler.disable()
+        elapsed = time.perf_counter() - start
+        stop.set()
+        sampler.join()
+        builtins.input = console_input
+        if mem:
+            snapshot_peak(peak, 1.0)
+            current, peak_size = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+    log(2, "Profiled \"", " ".join(args), "\" for %.3f seconds" % elapsed, sep='')
+    if profiler:
+        stats = pstats.Stats(profiler)
+        stats.dump_stats(path + ".prof")
+        previous = PROFILES.get(args[0], {})
+        latest = {}
+        for (filename, line, func), (cc, nc, tt, ct, callers) in stats.stats.items():
+            latest[(filename, func)] = latest.get((filename, func), 0) + ct
+        print("   cumtime    tottime    calls  function (change since last profile)")
+        top = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:PROFILE_TOP]
+        for (filename, line, func), (cc, nc, tt, ct, callers) in top:
+            change = previous.get((filename, func))
+            print("%10.4f %10.4f %8d  %s:%d(%s)" % (ct, tt, nc, os.path.basename(filename), line, func),
+                  "" if change is None else "(%+.4f)" % (latest[(filename, func)] - change))
+        PROFILES[args[0]] = latest
+    if mem:
+        print("Traced memory: %.1f KiB current, %.1f KiB peak" % (current / 1024, peak_size / 1024))
+        print("Allocation sites at %.1f KiB, the highest sampled:" % (peak["size"] / 1024))
+        print("      size    count  allocation site")
+        # the profiler's own sampling, threads and snapshots are not the command's memory
+        snapshot = peak["snapshot"].filter_traces([tracemalloc.Filter(False, path) for path in
+                                                   (__file__, threading.__file__, tracemalloc.__file__)])
+        for stat in snapshot.statistics("lineno")[:PROFILE_TOP]:
+            frame = stat.traceback[0]
+            print("%8.1f KiB %8d  %s:%d" % (stat.size / 1024, stat.count, frame.filename, frame.lineno))
+    with open(path + ".collapsed", "w") as out:
+        for stack, count in samples.items():
+            out.write(stack + " " + str(count) + "\n")
+    log(2, "Wrote", (path + ".prof and " if profiler else "") + path + ".collapsed")
+
+
 def log(level: int, *args, **kwargs):
     """Logs the message to console.
 
@@ -239,15 +434,7 @@ def main():
         i = input(PROMPT).strip().split()
         if not i:
             continue
-        elif not COMMANDS.get(i[0]):
-            log(2, "Command \"", i[0], "\" does not exist or is misspelled", sep='')
-        elif (COMMANDS.get(i[0])[1] != len(i) - 1) and (COMMANDS.get(i[0])[1] != -1):
-            log(2, "Invalid number of args for command ", i[0],
-                "(defined: ", COMMANDS.get(i[0])[1], ", passed: ", len(i) - 1, ")", sep="")
-        elif len(i) == 1:
-            COMMANDS[i[0]][0]()
-        else:
-            COMMANDS[i[0]][0](i[1:])
+        run_command(i)
 
 
 # Color     Text    BG  |   Style
@@ -276,7 +463,8 @@ COMMANDS = {
         "test": (test_module, -1, "Tests the specified module with the defined args"),
         "import_all": (import_all_commands, 0, "Loads all commands from modules"),
         "import": (import_module, 1, "Loads a specified module"),
-        "echo": (echo, 1, "Echos passed variable to the console")
+        "echo": (echo, 1, "Echos passed variable to the console"),
+        "profile": (profile_command, -1, "Profiles a command: [-t seconds] [-cpu | -mem] <command> [args]")
     }
 METADATA = {
     "Authors": ("Joshua Neighbarger", "Karan Singla", "Zachary Chandler"),
@@ -288,6 +476,10 @@ PROMPT = ">>>:  "
 MODULES = {}
 LOG_LEVEL = 4
 COLORS_ENABLED = True
+PROFILE_DIR = "profiles"
+PROFILE_TOP = 15
+SAMPLE_INTERVAL = 0.005
+PROFILES = {}
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,135 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Version: 19 October 2026
+
+""" Model Tools
+
+Offline tools for trained NLP models which do not need the message server to be running.
+
+    "compact_model": Prunes the pickled model and reports the size saved and held-out coverage lost. Arguments, all
+        optional and in order, are the minimum count of a key, the minimum count of a response, the maximum number
+        of responses per key (0 for no limit), "merge" to fold rare keys into the None fallback and the output path.
+    "batch_infer": Answers every line of a chat log with the pickled model across a pool of processes and writes the
+        prompt and response rows to an output file. Arguments are the input and output paths, then optionally the
+        number of worker processes and the random seed. Also runnable as "python _batch.py".
+    "shard_model": Splits the pickled model by key into the given number of shard pickles in _shard.SHARD_DIR, which
+        "start_server shards <count>" serves without loading the whole model.
+
+Attributes:
+    MODEL_PATH (str): The pickled model which the tools read.
+    COMPACT_PATH (str): The default output path of compact_model.
+
+"""
+
+import pickle
+import _model as model
+import _compact as compact
+import _batch as batch
+import _shard as shard
+
+MODEL_PATH = "model.p"
+COMPACT_PATH = "model.compact.p"
+
+
+def compact_model(*args: tuple):
+    """Compacts the pickled model and writes the result to a separate pickle.
+
+    The original model is left untouched so that several settings can be compared before choosing one to deploy.
+
+    Args:
+        *args: The minimum key count, minimum response count, maximum responses per key, "merge" and output path.
+
+    Returns:
+        None
+    """
+    args = list(args[0]) if args else []
+    try:
+        min_key_count = int(args[0]) if len(args) > 0 else 2
+        min_response_count = int(args[1]) if len(args) > 1 else 1
+        max_responses = int(args[2]) if len(args) > 2 else 0
+    except ValueError:
+        print("Counts must be integers")
+        return
+    merge_rare = len(args) > 3 and args[3] == "merge"
+    out_path = args[4] if len(args) > 4 else COMPACT_PATH
+
+    nlp_model = model.unpickleModel()
+    print("Retraining without the held-out slice...")
+    trained, samples = compact.splitHeldOut(nlp_model)
+    compacted = compact.compare(nlp_model, trained, samples, minKeyCount=min_key_count, minResponseCount=min_response_count,
+                                maxResponses=max_responses or None, mergeRare=merge_rare)
+    with open(out_path, "wb") as out:
+        pickle.dump(compacted, out, -1)
+    print("Compacted model written to", out_path)
+
+
+def batch_infer(*args: tuple):
+    """Runs every line of a chat log through the pickled model and reports the throughput and memory used.
+
+    Args:
+        *args: The input and output paths, optionally followed by the number of workers and the random seed.
+
+    Returns:
+        None
+    """
+    args = list(args[0]) if args else []
+    if len(args) < 2:
+        print("Usage: batch_infer <input> <output> [workers] [seed]")
+        return
+    try:
+        workers = int(args[2]) if len(args) > 2 else None
+        seed = int(args[3]) if len(args) > 3 else 0
+    except ValueError:
+        print("Workers and seed must be integers")
+        return
+    batch.report(*batch.runBatch(args[0], args[1], MODEL_PATH, workers, seed))
+    print("Responses written to", args[1])
+
+
+def shard_model(count: list):
+    """Splits the pickled model into shard pickles for start_server's shard mode.
+
+    Args:
+        count: The number of shards.
+
+    Returns:
+        None
+    """
+    if not count[0].isdigit() or int(count[0]) < 1:
+        print("The number of shards must be a positive integer")
+        return
+    for path in shard.writeShards(model.unpickleModel(MODEL_PATH), int(count[0])):
+        print("Wrote", path)
+
+
+def get_commands():
+    """Defines commands for this module.
+
+    Returns:
+        Dictionary of commands related to this module
+    """
+    return {
+        "compact_model": (compact_model, -1, "Prunes the model and reports memory saved and coverage lost."),
+        "batch_infer": (batch_infer, -1, "Answers each line of a file with the model: <in> <out> [workers] [seed]"),
+        "shard_model": (shard_model, 1, "Splits the model into shard pickles for start_server shards <count>.")
+    }
+
+
+def launch(*args: tuple):
+    """The main method.
+
+    Args:
+        *args: The launch arguments, beginning with the name of this module.
+
+    Returns:
+        None
+    """
+    if args and len(args[0]) > 1:
+        compact_model(args[0][1:])
+    else:
+        compact_model()
+
+
+def test():
+    pass
@@ -13,15 +13,47 @@ its nickname, followed by any plaintext (yet encoded) messages it wishes to send
 to its console and can interact through any of the following commands:
 
     "q": Quits/Kills the server and disconnects all clients
+    "stats": Prints the admission control counters
+    "reload_model": Loads MODEL_PATH, or the shard pickles, in the background and swaps it in once loaded
+    "load_test": Runs load_test against this server in the background, with the same optional arguments
     other: Sends typed message to all clients
 
+Each client may send RATE messages per second on average, in bursts of up to BURST, and at most MAX_IN_FLIGHT model
+calls run at once across all clients. A message over its client's rate is dropped unanswered before it is even
+unmasked, and the server stops reading from that client until it may send again, so that TCP holds back the rest of a
+flood. A message which cannot get a model call within QUEUE_DEADLINE seconds is answered with one of the model's
+fallback (None key) responses instead, which are always looked up in this process. Either way a flooding client cannot
+raise the reply latency of everyone else.
+
+The server also watches MODEL_PATH, or the shard pickles in shard mode, and reloads the model whenever a new snapshot
+is written there. Reloading happens on a separate thread while messages are still answered by the current model, which
+is then replaced by a single assignment of NLP_MODEL. Responses already being generated keep their reference to the old
+model and finish on it.
+
 Attributes:
     GUID (str): Globally Unique Identifier is used to add a false sense of integrity to the WebSocket protocol.
     HANDSHAKE_RESP (str): HTTP handshake response format. Necessary for client to recognize connection as valid.
     HOST (str): The hostname which this server is run on. If localhost, leave as a null string.
     PORT (str): The statically defined port on which the server will be hosted
+    FRAGMENT_SIZE (int): The largest payload, in bytes, of a frame sent to a client. Longer messages are fragmented.
+    MAX_MESSAGE_SIZE (int): The longest message, in bytes, a client may send. Clients sending longer ones are
+        disconnected.
     CLIENTS (dict): Maps all client addresses/names to their respective connection.
     THREADS (list): Contains all active Threads currently running from this module.
+    RATE (float): The number of messages per second each client's token bucket is refilled with.
+    BURST (int): The capacity of each client's token bucket.
+    MAX_IN_FLIGHT (int): The maximum number of model calls running at once.
+    QUEUE_DEADLINE (float): The number of seconds a message may wait for a model call before it is shed.
+    IN_FLIGHT (BoundedSemaphore): Limits the model calls running at once to MAX_IN_FLIGHT.
+    STATS (dict): Counts messages which were served by the model, rejected by their client's rate limit, queued for a
+        model call, and shed after queueing past the deadline.
+    MODEL_PATH (str): The pickled model loaded by the server, and watched for new snapshots while it runs.
+    WATCH_INTERVAL (float): The number of seconds between checks of MODEL_PATH for a new snapshot.
+    SHARD_GRACE (float): The number of seconds old model shards keep serving after a reload, so that lookups already
+        sent to them can finish.
+    NLP_MODEL (Model): The model answering messages, or a ShardedModel when the server runs in shard mode.
+    SERVING (Event): Set while start_server is running in this process.
+    RETIRED (dict): Maps the timer closing each model replaced in shard mode to that model.
 
 Todo:
     * Add returns definitions to docstrings
@@ -38,7 +70,10 @@ import time
 import sys
 import importlib
 import os
+import resource
 import _model as model
+import _shard as shard
+import _corpus as corpus
 
 GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
 HANDSHAKE_RESP = \
@@ -49,35 +84,132 @@ HANDSHAKE_RESP = \
     b"\r\n"
 HOST = b''
 PORT = 9876
+FRAGMENT_SIZE = 125
+MAX_MESSAGE_SIZE = 65536
 CLIENTS = {}
 THREADS = []
+RATE = 2.0
+BURST = 5
+MAX_IN_FLIGHT = os.cpu_count() or 4
+QUEUE_DEADLINE = 0.25
+IN_FLIGHT = threading.BoundedSemaphore(MAX_IN_FLIGHT)
+STATS = {"served": 0, "rejected": 0, "queued": 0, "shed": 0}
+STATS_LOCK = threading.Lock()
+MODEL_PATH = "model.p"
+WATCH_INTERVAL = 5.0
+SHARD_GRACE = 30.0
+NLP_MODEL = None
+SHARD_COUNT = 0
+RELOAD_LOCK = threading.Lock()
+SERVING = threading.Event()
+RETIRED = {}
+
+
+class TokenBucket:
+    """Rate limits a single client's messages.
+
+    Attributes:
+        tokens (float): The number of messages the client may currently send.
+        updated (float): The time at which tokens was last refilled.
+    """
+
+    def __init__(self):
+        self.tokens = float(BURST)
+        self.updated = time.monotonic()
+
+    def take(self) -> bool:
+        """Takes a token for one message if one is available.
+
+        Returns:
+            If the message is within the client's rate.
+        """
+        now = time.monotonic()
+        self.tokens = min(BURST, self.tokens + (now - self.updated) * RATE)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
 
+    def delay(self) -> float:
+        """Finds how long the client must wait before its next message is within its rate.
 
-def get_str_from_socket(data: str):
-    """Encodes and unmasks str object from the passed HTTP response.
+        Returns:
+            The number of seconds until a token is available.
+        """
+        tokens = min(BURST, self.tokens + (time.monotonic() - self.updated) * RATE)
+        return max(0.0, (1 - tokens) / RATE)
+
+
+def split_frames(data: bytearray) -> tuple:
+    """Finds the complete WebSocket frames at the front of the bytes received so far, without unmasking them.
+
+    A single recv may hold several frames, or only part of one, so the caller keeps whatever follows the complete
+    frames and appends the next bytes received to it. Payloads are left masked so that frames which are dropped cost
+    no more than reading their headers.
 
     Args:
-        data: The decoded and masked byte string data from the HTTP client.
+        data: The bytes received from the client and not yet parsed.
 
     Returns:
-        Plaintext Python str
+        A list of (fin, opcode, mask key, payload start, payload end) for each complete frame, and the number of bytes
+        those frames take up.
+
+    Raises:
+        ValueError: If a frame is longer than MAX_MESSAGE_SIZE.
     """
-    # data comes in as byte_string
-    data_byte = bytearray(data)
-    # data_len is the length of the string
-    data_len = (0x7F & data_byte[1])
-    str_data = ''
-    if data_len > 0:
-        mask_key = data_byte[2:6]
-        masked_data = data_byte[6:(6 + data_len)]
-        unmasked_data = [masked_data[i] ^ mask_key[i % 4] for i in range(len(masked_data))]
-        str_data = str_data.join(map(chr, unmasked_data))
-    return str_data
+    frames = []
+    pos = 0
+    while len(data) - pos >= 2:
+        length = data[pos + 1] & 0x7F
+        start = pos + 2
+        if length == 126:
+            if len(data) < start + 2:
+                break
+            length = int.from_bytes(data[start:start + 2], 'big')
+            start += 2
+        elif length == 127:
+            if len(data) < start + 8:
+                break
+            length = int.from_bytes(data[start:start + 8], 'big')
+            start += 8
+        if length > MAX_MESSAGE_SIZE:
+            raise ValueError("frame of %d bytes is too long" % length)
+        mask_key = None
+        if data[pos + 1] & 0x80:
+            mask_key = bytes(data[start:start + 4])
+            start += 4
+        if len(data) < start + length:
+            break
+        frames.append((bool(data[pos] & 0x80), data[pos] & 0x0F, mask_key, start, start + length))
+        pos = start + length
+    return frames, pos
+
+
+def unmask(payload: bytes, mask_key: bytes) -> bytes:
+    """Unmasks the payload of a frame sent by a client.
+
+    Args:
+        payload: The masked payload.
+        mask_key: The frame's 4 byte mask key, or None if the payload is not masked.
+
+    Returns:
+        The unmasked payload.
+    """
+    if not mask_key:
+        return payload
+    size = len(payload)
+    # one XOR of two big integers rather than one per byte
+    key = (mask_key * (size // 4 + 1))[:size]
+    return (int.from_bytes(payload, 'little') ^ int.from_bytes(key, 'little')).to_bytes(size, 'little')
 
 
 def message_client(conn: socket, message: str):
     """Sends decoded string to client on given socket.
 
+    Messages over FRAGMENT_SIZE bytes are sent as a text frame followed by continuation frames, which the client joins
+    back into one message.
+
     Args:
         conn: The client's respective connection.
         message: The encoded string message which will be sent.
@@ -85,19 +217,16 @@ def message_client(conn: socket, message: str):
     Returns:
         None
     """
-    if len(message) > 100:
-        print("Message over 50 chars long.")
-        message_client(conn, message[:99])
-        message_client(conn, message[99:])
-    else:
-        try:
-            resp = bytearray([0b10000001, len(message)])
-        except ValueError:
-            message_client(conn, generate_message_response(message))
-        for d in bytearray(message, 'utf-8'):
-            resp.append(d)
-        conn.sendall(resp)
-        print(conn.getpeername(), "Server:", message)
+    data = message.encode('utf-8')
+    chunks = [data[i:i + FRAGMENT_SIZE] for i in range(0, len(data), FRAGMENT_SIZE)] or [b""]
+    resp = bytearray()
+    for i, chunk in enumerate(chunks):
+        # only the first frame is a text frame (0x1), the rest are continuations (0x0) and only the last has FIN set
+        resp.append((0x80 if i == len(chunks) - 1 else 0) | (0x1 if i == 0 else 0x0))
+        resp.append(len(chunk))
+        resp += chunk
+    conn.sendall(resp)
+    print(conn.getpeername(), "Server:", message)
 
 
 
@@ -118,20 +247,57 @@ def handle_client(conn: socket, addr: tuple):
     print(addr, "Connection opened. Waiting for nickname...")
     CLIENTS[addr] = conn
     name = ""
-    while 1:
+    history = []
+    bucket = TokenBucket()
+    buffer = bytearray()
+    fragments = bytearray()
+    dropping = False
+    closed = False
+    while not closed:
         try:
             data = conn.recv(8192)
-            if (not data) or (data[0] == 0x88 and data[1] == 0x82):
+            if not data:
                 break
-            elif not len(name):
-                name = get_str_from_socket(data)
-                print(addr, "Connected as", name)
-            else:
-                message = get_str_from_socket(data)
+            buffer += data
+            frames, used = split_frames(buffer)
+            for fin, opcode, mask_key, start, end in frames:
+                if opcode == 0x8:
+                    closed = True
+                    break
+                elif opcode not in (0x0, 0x1):
+                    continue  # pings, pongs and binary frames are ignored
+                if opcode == 0x1 and len(name):
+                    # messages over the client's rate are dropped before they are unmasked or decoded
+                    dropping = not bucket.take()
+                    if dropping:
+                        count("rejected")
+                if not dropping:
+                    fragments += unmask(bytes(buffer[start:end]), mask_key)
+                    if len(fragments) > MAX_MESSAGE_SIZE:
+                        raise ValueError("message is too long")
+                if not fin or dropping:
+                    continue
+                message = fragments.decode('utf-8', 'replace')
+                fragments = bytearray()
+                if not len(name):
+                    name = message
+                    print(addr, "Connected as", name)
+                    continue
                 print(conn.getpeername(), ' ', name, ": ", message, sep='')
-                message_client(conn, generate_message_response(message))
+                response = admit_message(message, history)
+                message_client(conn, response)
+                history.extend((message, response))
+                # the loaded model, not _model.CONTEXT_SIZE, decides how much context is used
+                del history[:max(0, len(history) - (NLP_MODEL.getContextSize() - 1))]
+            del buffer[:used]
+            if dropping:
+                # stops reading until the client may send again, so TCP holds back the rest of a flood
+                time.sleep(bucket.delay())
         except socket.timeout:
             continue
+        except ValueError as e:
+            print(addr, "Closing connection:", e)
+            break
         except ConnectionResetError:
             break
         except OSError:
@@ -211,66 +377,493 @@ def handle_server(s: socket):
     while 1:
         try:
             conn, addr = s.accept()
-            handshake(conn)
-            conn.settimeout(5)
-            t = threading.Thread(target=handle_client, args=(conn, addr))
-            THREADS.append(t)
-            t.start()
-        except ConnectionAbortedError:
+        except OSError:  # raised on Linux once start_server shuts the socket down, ConnectionAbortedError elsewhere
             print("Socket closed by server")
             break
+        try:
+            handshake(conn)
+        except OSError:
+            conn.close()
+            continue
+        conn.settimeout(5)
+        t = threading.Thread(target=handle_client, args=(conn, addr))
+        THREADS.append(t)
+        t.start()
 
 
-def start_server():
+def close_socket(s: socket):
+    """Shuts down and closes a socket, waking any thread blocked in accept or recv on it.
+
+    Args:
+        s: The socket to close.
+
+    Returns:
+        None
+    """
+    try:
+        s.shutdown(socket.SHUT_RDWR)
+    except OSError:  # not connected
+        pass
+    s.close()
+
+
+def start_server(*args: tuple):
     """ Starts the server.
 
+    Passing "shards" and a count serves the model from that many local model server processes, started from the shard
+    pickles written by the shard_model command, which the server queries over Unix domain sockets. The server then
+    never loads the whole model itself.
+
+    Args:
+        *args: Optionally "shards" followed by the number of shard processes.
+
     Returns:
         None
     """
     global NLP_MODEL
+    global SHARD_COUNT
+    args = list(args[0]) if args else []
+    shard_count = 0
+    if args:
+        if len(args) != 2 or args[0] != "shards" or not args[1].isdigit() or int(args[1]) < 1:
+            print("Usage: start_server [shards <count>]")
+            return
+        shard_count = int(args[1])
     print("\nLoading NLP model...")
-    if os.path.exists(os.path.abspath(os.path.join(__file__, '../../model.p'))):
+    if shard_count:
+        print("Starting", shard_count, "model shards...")
+        try:
+            NLP_MODEL = shard.openShards(shard_count)[0]
+        except FileNotFoundError as e:
+            print(e, "- split the model with \"shard_model", shard_count, "\" first")
+            return
+    elif os.path.exists(MODEL_PATH):
         print("Opening pickle...")
-        NLP_MODEL = model.unpickleModel()
+        NLP_MODEL = model.unpickleModel(MODEL_PATH)
         pass
     else:
         print("Training data...")
         NLP_MODEL = model.generate()
         pass
+    SHARD_COUNT = shard_count
     print("Starting server...")
     s = acquire_socket()
     server_thread = threading.Thread(target=handle_server, args=(s,))
     THREADS.append(server_thread)
     server_thread.start()
+    SERVING.set()
+    stop_watching = threading.Event()
+    threading.Thread(target=watch_model, args=(stop_watching,), daemon=True).start()
     while 1:
         i = input().strip()
         if i == "q" or i == "quit":
             print("Killing server with", len(THREADS), "threads and", len(CLIENTS), "clients...")
-            s.close()
-            for client in CLIENTS:
-                CLIENTS[client].close()
-            for t in THREADS:
+            stop_watching.set()
+            SERVING.clear()
+            # closing a socket does not wake threads blocked on it, shutting it down does
+            close_socket(s)
+            for conn in list(CLIENTS.values()):
+                close_socket(conn)
+            for t in list(THREADS):
                 t.join()
+            # waits for a reload in progress, so that no shards are started after the server stops
+            with RELOAD_LOCK:
+                close_retired()
+                if shard_count:
+                    NLP_MODEL.close()
             print("Server terminated\n")
             return
+        elif i == "stats":
+            print_stats()
+        elif i == "reload_model":
+            reload_model()
+        elif i.split()[:1] == ["load_test"]:
+            threading.Thread(target=load_test, args=(i.split()[1:],), daemon=True).start()
         else:
             for client in CLIENTS:
                 message_client(CLIENTS[client], i)
             print("Successfully messaged", len(CLIENTS.keys()), "client(s)")
 
 
-def generate_message_response(message: str):
-    return NLP_MODEL.findResponse(message)
+def reload_model():
+    """Runs swap_model on a background thread, unless a reload is already in progress.
+
+    Returns:
+        None
+    """
+    if RELOAD_LOCK.locked():
+        print("Model reload already in progress")
+        return
+    threading.Thread(target=swap_model, daemon=True).start()
+
+
+def swap_model():
+    """Loads MODEL_PATH and replaces NLP_MODEL with it, reporting the load time and the peak memory of the load.
+
+    Memory is reported from getrusage as how much the load raised this process's peak resident set size, and in shard
+    mode also the peak of each new shard process.
+
+    The old model is never modified, so messages being answered while this runs are unaffected. If the new model cannot
+    be loaded the old one is kept. In shard mode new shard processes are started from the shard pickles, and the old ones
+    are stopped SHARD_GRACE seconds after the swap.
+
+    Returns:
+        None
+    """
+    global NLP_MODEL
+    if not RELOAD_LOCK.acquire(blocking=False):
+        return
+    try:
+        print("Reloading NLP model from", (shard.SHARD_DIR if SHARD_COUNT else MODEL_PATH) + "...")
+        # ru_maxrss is in KiB on Linux
+        own_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        peaks = []
+        try:
+            if SHARD_COUNT:
+                new_model, peaks = shard.openShards(SHARD_COUNT)
+            else:
+                new_model = model.unpickleModel(MODEL_PATH)
+        except Exception as e:  # Broad Exception intentional; a bad snapshot must not take the server down
+            print("Model reload failed, keeping the current model:", repr(e))
+            return
+        elapsed = time.perf_counter() - start
+        own_growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - own_before
+        old_model = NLP_MODEL
+        NLP_MODEL = new_model
+        report = "Model swapped in %.2f s, peak memory +%.1f MiB" % (elapsed, own_growth / 1024)
+        if peaks:
+            report += ", %s MiB in the shards" % ", ".join("%.1f" % (peak / 1024) for peak in peaks)
+        print(report)
+        if SHARD_COUNT and old_model is not None:
+            retire_model(old_model)
+    finally:
+        RELOAD_LOCK.release()
+
+
+def retire_model(old_model: shard.ShardedModel):
+    """Closes a replaced model's shards SHARD_GRACE seconds from now, so that lookups already sent to them can finish.
+
+    Args:
+        old_model: The replaced model.
+
+    Returns:
+        None
+    """
+    def close():
+        # whichever of this timer and close_retired pops the model closes it
+        if RETIRED.pop(timer, None) is not None:
+            old_model.close()
+
+    timer = threading.Timer(SHARD_GRACE, close)
+    timer.daemon = True
+    RETIRED[timer] = old_model
+    timer.start()
+
+
+def close_retired():
+    """Closes every replaced model still waiting out its grace period.
+
+    Returns:
+        None
+    """
+    for timer in list(RETIRED):
+        timer.cancel()
+        old_model = RETIRED.pop(timer, None)
+        if old_model is not None:
+            old_model.close()
+
+
+def watch_model(stop: threading.Event):
+    """Reloads the model whenever a new snapshot is written to MODEL_PATH, or to the shard pickles in shard mode.
+
+    A snapshot is only loaded once its sizes and modification times are unchanged for a whole WATCH_INTERVAL, so that a
+    pickle which is still being written is not read.
+
+    Args:
+        stop: Set when the server stops.
+
+    Returns:
+        None
+    """
+    paths = shard.getShardPaths(SHARD_COUNT) if SHARD_COUNT else [MODEL_PATH]
+
+    def snapshot():
+        try:
+            return tuple((stat.st_mtime_ns, stat.st_size) for stat in map(os.stat, paths))
+        except OSError:
+            return None
+
+    loaded = snapshot()
+    seen = loaded
+    while not stop.wait(WATCH_INTERVAL):
+        current = snapshot()
+        if current is not None and current != loaded and current == seen:
+            loaded = current
+            swap_model()
+        seen = current
+
+
+def count(stat: str):
+    """Increments one of the admission control counters.
+
+    Args:
+        stat: The name of the counter in STATS.
+
+    Returns:
+        None
+    """
+    with STATS_LOCK:
+        STATS[stat] += 1
+
+
+def print_stats():
+    """Prints the admission control counters.
+
+    Returns:
+        None
+    """
+    with STATS_LOCK:
+        print(", ".join(stat + ": " + str(STATS[stat]) for stat in STATS))
+
+
+def admit_message(message: str, history: list):
+    """Responds to a client's message through the model, unless the server is overloaded.
+
+    The message waits up to QUEUE_DEADLINE seconds for one of the MAX_IN_FLIGHT model calls, and is answered with a
+    fallback response if none frees up in time.
+
+    Args:
+        message: The message sent by the client, which is within the client's rate.
+        history: The preceding messages of the conversation, oldest first.
+
+    Returns:
+        The response to be sent to the client.
+    """
+    if not IN_FLIGHT.acquire(blocking=False):
+        count("queued")
+        if not IN_FLIGHT.acquire(timeout=QUEUE_DEADLINE):
+            count("shed")
+            return generate_fallback_response()
+    try:
+        count("served")
+        return generate_message_response(message, history)
+    finally:
+        IN_FLIGHT.release()
+
+
+def generate_fallback_response():
+    """Picks one of the model's responses to unrecognized messages, which skips parsing the message entirely.
+
+    Returns:
+        The response to be sent to the client.
+    """
+    # a ShardedModel keeps its own copy of the None responses, so this never waits on a shard
+    return NLP_MODEL.findResponse(None)
+
+
+def generate_message_response(message: str, history: list=None):
+    """Finds the model's response to a message.
+
+    Args:
+        message: The message sent by the client.
+        history: The preceding messages of the conversation, oldest first, used as context by the model.
+
+    Returns:
+        The response to be sent to the client.
+    """
+    # NLP_MODEL is read once, so a reload swapping it meanwhile cannot change the model used for this message
+    return NLP_MODEL.findResponse(message, history)
     # return "How are you?"
 
 
+def ws_connect(name: str) -> socket:
+    """Connects to the server running on PORT as a WebSocket client would.
+
+    Args:
+        name: The nickname to connect with.
+
+    Returns:
+        The connected socket.
+    """
+    conn = socket.create_connection(("localhost", PORT))
+    conn.sendall(b"GET / HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n" +
+                 b"Sec-WebSocket-Key: " + base64.b64encode(os.urandom(16)) + b"\r\nSec-WebSocket-Version: 13\r\n\r\n")
+    data = b""
+    while b"\r\n\r\n" not in data:
+        chunk = conn.recv(4096)
+        if not chunk:
+            raise ConnectionResetError("handshake refused")
+        data += chunk
+    ws_send(conn, name)
+    return conn
+
+
+def ws_send(conn: socket, message: str):
+    """Sends a masked text frame, as required of WebSocket clients.
+
+    Args:
+        conn: The connection to the server.
+        message: The message, at most 65535 bytes once encoded.
+
+    Returns:
+        None
+    """
+    data = message.encode('utf-8')[:0xFFFF]
+    mask = os.urandom(4)
+    if len(data) < 126:
+        header = bytes([0b10000001, 0x80 | len(data)])
+    else:
+        header = bytes([0b10000001, 0x80 | 126]) + len(data).to_bytes(2, 'big')
+    conn.sendall(header + mask + bytes(b ^ mask[i % 4] for i, b in enumerate(data)))
+
+
+def ws_recv_exactly(conn: socket, size: int) -> bytes:
+    """Receives exactly size bytes from the server.
+
+    Args:
+        conn: The connection to the server.
+        size: The number of bytes to receive.
+
+    Returns:
+        The received bytes.
+    """
+    data = b""
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise ConnectionResetError("connection closed")
+        data += chunk
+    return data
+
+
+def ws_recv(conn: socket) -> str:
+    """Receives one message from the server, joining the frames message_client splits long messages into.
+
+    Args:
+        conn: The connection to the server.
+
+    Returns:
+        The received message.
+    """
+    message = bytearray()
+    while 1:
+        header = ws_recv_exactly(conn, 2)
+        length = header[1] & 0x7F
+        if length == 126:
+            length = int.from_bytes(ws_recv_exactly(conn, 2), 'big')
+        elif length == 127:
+            length = int.from_bytes(ws_recv_exactly(conn, 8), 'big')
+        data = ws_recv_exactly(conn, length)
+        if header[0] & 0x0F == 0x8:
+            raise ConnectionResetError("connection closed by server")
+        message += data
+        if header[0] & 0x80:
+            return message.decode('utf-8', 'replace')
+
+
+def load_test(*args: tuple):
+    """Measures the reply latency of well-behaved clients while abusive clients flood the server running on PORT.
+
+    Well-behaved clients send one message per second and wait for each reply. Abusive clients send messages as fast as
+    they can without waiting. Run it from a second console while start_server is running, and compare the latency
+    percentiles with and without abusive clients. Run as "load_test" on the server's own console, it also reports how
+    the server disposed of the messages sent during the test.
+
+    Args:
+        *args: Optionally the number of well-behaved clients, the number of abusive clients and the duration in seconds.
+
+    Returns:
+        None
+    """
+    args = list(args[0]) if args else []
+    try:
+        good = int(args[0]) if len(args) > 0 else 8
+        abusive = int(args[1]) if len(args) > 1 else 2
+        duration = float(args[2]) if len(args) > 2 else 20
+    except ValueError:
+        print("Usage: load_test [clients] [abusive clients] [seconds]")
+        return
+    messages = [m for c in corpus.readConversations(corpus.getTrainingFiles()[0]) for m in c]
+    latencies = []
+    failures = []
+    flooded = []
+    # the server's counters are only visible when it runs in this process
+    in_process = SERVING.is_set()
+    with STATS_LOCK:
+        stats_before = dict(STATS)
+    deadline = time.time() + duration
+
+    def behave(n):
+        try:
+            conn = ws_connect("client" + str(n))
+            conn.settimeout(10)
+            i = n
+            while time.time() < deadline:
+                start = time.perf_counter()
+                ws_send(conn, messages[i % len(messages)])
+                ws_recv(conn)
+                latencies.append(time.perf_counter() - start)
+                i += 1
+                time.sleep(1)
+            conn.close()
+        except OSError as e:
+            failures.append(e)
+
+    def drain(conn):
+        try:
+            while conn.recv(1 << 16):
+                pass
+        except OSError:
+            pass
+
+    def abuse(n):
+        try:
+            conn = ws_connect("abuser" + str(n))
+            threading.Thread(target=drain, args=(conn,), daemon=True).start()
+            sent = 0
+            while time.time() < deadline:
+                ws_send(conn, messages[sent % len(messages)])
+                sent += 1
+            flooded.append(sent)
+            conn.close()
+        except OSError as e:
+            failures.append(e)
+
+    threads = [threading.Thread(target=behave, args=(n,)) for n in range(good)] + \
+              [threading.Thread(target=abuse, args=(n,)) for n in range(abusive)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    latencies.sort()
+    print("Abusive clients sent", sum(flooded), "messages;", len(failures), "clients failed")
+    if in_process:
+        time.sleep(1)  # lets the server answer the last messages received
+        with STATS_LOCK:
+            delta = {k: STATS[k] - stats_before[k] for k in STATS}
+        print("Server received %d messages: %d served, %d rejected, %d queued, %d shed" % (
+            delta["served"] + delta["rejected"] + delta["shed"], delta["served"], delta["rejected"], delta["queued"],
+            delta["shed"]))
+    else:
+        print("Compare with the server's \"stats\" before and after the test")
+    if latencies:
+        print("Well-behaved replies: %d, p50 %.1f ms, p99 %.1f ms, max %.1f ms" % (
+            len(latencies), 1000 * latencies[len(latencies) // 2],
+            1000 * latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 1000 * latencies[-1]))
+
+
 def get_commands():
     """Defines commands for this module.
 
     Returns:
         Dictionary of commands related to this module
     """
-    return {"start_server": (start_server, 0, "Starts the message server.")}
+    return {
+        "start_server": (start_server, -1, "Starts the message server, optionally as: shards <count>."),
+        "load_test": (load_test, -1, "Load tests a running server: [clients] [abusive clients] [seconds]")
+    }
 
 
 def launch():
@@ -13,6 +13,7 @@ the trained tagger remains small.
 Attributes:
     CUTOFF (int): Determines the number of occurrences required for the next tagger to replace the tag. The lower this
         value, the higher the accuracy will likely be, but the larger the trained file size is likely to be.
+    CACHE_DIR (str): The folder in which tagged sentences read from NLTK corpora are cached as pickles.
 
 Todo:
     * Replace words not in lexicon to UNK.
@@ -30,11 +31,16 @@ Todo:
             The estimated accuracy of the tagger
         """
 
+import os
+import time
 import nltk
 from nltk.corpus import *
-from pickle import dump, load
+from pickle import dump, dumps, load
+from concurrent.futures import ProcessPoolExecutor
 
 CUTOFF = 2
+CACHE_DIR = os.path.abspath(os.path.join(__file__, '../../../tagger_cache'))
+_SENTS = None
 
 
 class MyTagger:
@@ -54,11 +60,7 @@ class MyTagger:
         sents = corpus.tagged_sents(corpus.fileids())
         training_data = sents[int(len(sents) * 0.9):]
         testing_data = sents[:int(len(sents) * 0.1)]
-        t0 = nltk.DefaultTagger('NN')
-        t1 = nltk.UnigramTagger(training_data, cutoff=CUTOFF, backoff=t0)
-        t2 = nltk.BigramTagger(training_data, cutoff=CUTOFF, backoff=t1)
-        t3 = nltk.TrigramTagger(training_data, cutoff=CUTOFF, backoff=t2)
-        self.tagger = t3
+        self.tagger = build_tagger(training_data)
         if self.path:
             self.save(self.path)
         return self.evaluate(testing_data)
@@ -80,6 +82,140 @@ class MyTagger:
             dump(self.tagger, out, -1)
 
 
+def build_tagger(sents: list, cutoff: int=CUTOFF):
+    """Trains the default, unigram, bigram and trigram backoff taggers.
+
+    Args:
+        sents: The tagged sentences on which to train.
+        cutoff: The number of occurrences a context needs to be kept by each n-gram tagger.
+
+    Returns:
+        The trigram tagger, which backs off to the others.
+    """
+    t0 = nltk.DefaultTagger('NN')
+    t1 = nltk.UnigramTagger(sents, cutoff=cutoff, backoff=t0)
+    t2 = nltk.BigramTagger(sents, cutoff=cutoff, backoff=t1)
+    return nltk.TrigramTagger(sents, cutoff=cutoff, backoff=t2)
+
+
+def load_tagged_sents(name: str) -> list:
+    """Loads the tagged sentences of the named NLTK corpus, reading them from the cache when possible.
+
+    Reading a corpus through NLTK's readers is far slower than unpickling the resulting lists, so the first load of each
+    corpus is written to CACHE_DIR.
+
+    Args:
+        name: The name of the corpus in nltk.corpus (i.e.: brown, treebank).
+
+    Returns:
+        A list of tagged sentences, each a list of (word, tag) tuples.
+    """
+    path = os.path.join(CACHE_DIR, name + ".tagged.p")
+    if os.path.exists(path):
+        with open(path, 'rb') as src:
+            return load(src)
+    corpus = getattr(nltk.corpus, name)
+    sents = [list(sent) for sent in corpus.tagged_sents(corpus.fileids())]
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(path + ".tmp", 'wb') as out:
+        dump(sents, out, -1)
+    os.replace(path + ".tmp", path)
+    return sents
+
+
+def _init_worker(name: str):
+    """Loads the cached sentences once per worker process."""
+    global _SENTS
+    _SENTS = load_tagged_sents(name)
+
+
+def _run_fold(fold: int, k: int, cutoff: int) -> dict:
+    """Trains on every fold but one and evaluates on the remaining fold.
+
+    Args:
+        fold: The index of the held-out fold.
+        k: The number of folds.
+        cutoff: The cutoff passed to each n-gram tagger.
+
+    Returns:
+        The fold, cutoff, accuracy (None if the fold is empty), training time in seconds and pickled size in bytes.
+    """
+    testing_data = _SENTS[fold::k]
+    training_data = [sent for i, sent in enumerate(_SENTS) if i % k != fold]
+    start = time.perf_counter()
+    tagger = build_tagger(training_data, cutoff)
+    train_time = time.perf_counter() - start
+    return {
+        "fold": fold,
+        "cutoff": cutoff,
+        "accuracy": tagger.evaluate(testing_data) if testing_data else None,
+        "time": train_time,
+        "size": len(dumps(tagger, -1))
+    }
+
+
+def cross_validate(name: str="brown", k: int=5, cutoffs: tuple=(CUTOFF,), processes: int=None) -> list:
+    """Runs k-fold cross validation of the tagger for each cutoff across a pool of processes.
+
+    Args:
+        name: The name of the NLTK corpus on which to train.
+        k: The number of folds.
+        cutoffs: The cutoff values to compare.
+        processes: The number of worker processes, defaulting to the number of CPUs.
+
+    Returns:
+        The result of each fold, as returned by _run_fold, ordered by cutoff and fold.
+    """
+    load_tagged_sents(name)  # fills the cache before the workers read it
+    jobs = [(fold, k, cutoff) for cutoff in cutoffs for fold in range(k)]
+    with ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(name,)) as pool:
+        return list(pool.map(_run_fold, *zip(*jobs)))
+
+
+def print_results(results: list):
+    """Prints the per-fold and mean accuracy, training time and size of each cutoff.
+
+    Args:
+        results: The fold results returned by cross_validate.
+
+    Returns:
+        None
+    """
+    for cutoff in sorted(set(r["cutoff"] for r in results)):
+        folds = [r for r in results if r["cutoff"] == cutoff]
+        scored = [r["accuracy"] for r in folds if r["accuracy"] is not None]
+        print("CUTOFF =", cutoff)
+        for r in folds:
+            print("\tfold ", r["fold"], ":\taccuracy ",
+                  "n/a" if r["accuracy"] is None else "%.4f" % r["accuracy"],
+                  "\ttime %.2fs" % r["time"], "\tsize %d KiB" % (r["size"] // 1024), sep="")
+        print("\tmean:\taccuracy ", "%.4f" % (sum(scored) / len(scored)) if scored else "n/a",
+              "\ttime %.2fs" % (sum(r["time"] for r in folds) / len(folds)),
+              "\tsize %d KiB" % (sum(r["size"] for r in folds) // len(folds) // 1024), sep="")
+
+
+def evaluate_tagger(*args: tuple):
+    """Cross validates the tagger on the Brown corpus and prints the results for each cutoff.
+
+    Args:
+        *args: Optionally the number of folds, followed by the cutoffs to compare.
+
+    Returns:
+        None
+    """
+    args = list(args[0]) if args else []
+    try:
+        k = int(args[0]) if args else 5
+        cutoffs = tuple(int(c) for c in args[1:]) or (CUTOFF,)
+    except ValueError:
+        print("Folds and cutoffs must be integers")
+        return
+    if k < 2:
+        print("At least 2 folds are required")
+        return
+    print_results(cross_validate("brown", k, cutoffs))
+
+
 def test_tag():
     message = input("What to tag?  ")
     tagger = MyTagger()
@@ -91,7 +227,10 @@ def test_tag():
 
 
 def get_commands():
-    return {"tag": (test_tag, 0, "Tags the passed message and outputs to the console.")}
+    return {
+        "tag": (test_tag, 0, "Tags the passed message and outputs to the console."),
+        "tag_eval": (evaluate_tagger, -1, "Cross validates the tagger: [folds] [cutoffs...]")
+    }
 
 
 def launch():
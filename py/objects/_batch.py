@@ -0,0 +1,126 @@
+#!/usr/bin/python
+# Version: 19 October 2026
+
+"""Batch
+
+Streams a chat log through a pickled Model without the message server, writing a tab separated prompt and response
+row for every non-blank line, in input order. Lines are read and sent to a pool of worker processes in chunks, each
+worker unpickling the model once, and only a few chunks are in flight at a time so the input may be of any size.
+
+Like the training files, the log is one conversation per block of lines separated by blank lines, and each prompt
+is answered with the lines before it in its conversation as context. Each chunk reseeds random from the seed and its
+own index, so a run with the same seed, model and chunk size gives the same output whatever the number of workers.
+
+Usage: python _batch.py input output [--model model.p] [--workers N] [--seed S] [--encoding utf-8]
+"""
+
+import argparse
+import collections
+import multiprocessing
+import os
+import pickle
+import random
+import resource
+import time
+
+CHUNK_SIZE = 256
+
+_model = None
+
+
+def initWorker(modelPath):
+    global _model
+    with open(modelPath, "rb") as f:
+        _model = pickle.load(f)
+
+def workerContextSize():
+    return _model.getContextSize()
+
+def inferChunk(chunk):
+    # chunk is (index, seed, lines before the chunk needed as context, lines). Returns the rows answered and the peak
+    # memory of this worker so far, in KiB on Linux.
+    index, seed, head, lines = chunk
+    random.seed(seed * 1000003 + index)
+    size = _model.getContextSize()
+    history = []
+    rows = []
+    for i, line in enumerate(head + lines):
+        if not line or line.isspace():
+            history = []
+            continue
+        if i >= len(head):
+            rows.append((line, _model.findResponse(line, history)))
+        history.append(line)
+        del history[:max(0, len(history) - (size - 1))]
+
+    return rows, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def readChunks(f, seed, size):
+    head = []
+    lines = []
+    index = 0
+    for line in f:
+        lines.append(line.rstrip("\r\n"))
+        if len(lines) == CHUNK_SIZE:
+            yield index, seed, head, lines
+            head = lines[-(size - 1):] if size > 1 else []
+            lines = []
+            index += 1
+
+    if lines:
+        yield index, seed, head, lines
+
+def clean(text):
+    return text.replace("\t", " ").replace("\n", " ")
+
+def runBatch(inputPath, outputPath, modelPath="model.p", workers=None, seed=0, encoding="utf-8"):
+    # Returns (lines answered, seconds taken, peak memory of the largest worker in KiB).
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    count = 0
+    workerPeak = 0
+    pending = collections.deque()
+    with multiprocessing.Pool(workers, initializer=initWorker, initargs=(modelPath,)) as pool, \
+            open(inputPath, "r", encoding=encoding, errors="replace") as src, \
+            open(outputPath, "w", encoding="utf-8") as out:
+        # asked of a worker, so that this process never unpickles the model
+        size = pool.apply(workerContextSize)
+
+        def write(result):
+            nonlocal workerPeak
+            rows, maxrss = result
+            workerPeak = max(workerPeak, maxrss)
+            for prompt, response in rows:
+                out.write(clean(prompt) + "\t" + clean(response) + "\n")
+            return len(rows)
+
+        for chunk in readChunks(src, seed, size):
+            pending.append(pool.apply_async(inferChunk, (chunk,)))
+            if len(pending) >= 2 * workers:
+                count += write(pending.popleft().get())
+        while pending:
+            count += write(pending.popleft().get())
+
+        pool.close()
+        pool.join()
+
+    return count, time.perf_counter() - start, workerPeak
+
+def report(count, seconds, workerPeak):
+    # ru_maxrss is in KiB on Linux. The workers report their own peaks, since RUSAGE_CHILDREN would also cover every
+    # earlier child of this process.
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print("Answered %d lines in %.2f s (%.0f lines/s)" % (count, seconds, count / seconds if seconds else 0))
+    print("Peak memory: %.1f MiB in this process, %.1f MiB in the largest worker" % (own / 1024, workerPeak / 1024))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answers every line of a chat log with a pickled model.")
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("--model", default="model.p")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--encoding", default="utf-8")
+    args = parser.parse_args()
+    report(*runBatch(args.input, args.output, args.model, args.workers, args.seed, args.encoding))
@@ -0,0 +1,147 @@
+#!/usr/bin/python
+# Version: 19 October 2026
+
+"""Compact
+
+Prunes a trained Model so that it fits a memory budget. Models trained on large chat logs keep every key seen once and
+every reply given once, most of which never match again. Compaction drops them by count, caps the number of responses
+kept per key and can fold the responses of rare keys into the None fallback bucket instead of losing them.
+
+Because every cutoff trades size for replies, compare reports the pickled size of the model before and after
+compaction, and how well a held-out slice of the training files is covered. The deployed model was trained on every
+line, so coverage is measured on a separate model retrained without the held-out slice and compacted the same way;
+only then does it show how often pruned keys would have matched new messages.
+"""
+
+import pickle
+import _corpus
+from _model import Model, CUTOFF
+
+# The fraction at the end of each training file's conversations used as the held-out slice.
+HOLDOUT = 0.1
+
+
+def pruneResponses(responses, minResponseCount=1, maxResponses=None):
+    kept = [r for r in responses if r[1] >= minResponseCount]
+    if maxResponses is not None and len(kept) > maxResponses:
+        kept.sort(key=lambda r: r[1], reverse=True)
+        del kept[maxResponses:]
+    return kept
+
+def compactModel(model, minKeyCount=1, minResponseCount=1, maxResponses=None, mergeRare=False):
+    # Compacts model in place. The None key is never removed since every unmatched message falls back to it. The
+    # contexts of a removed key go with it, so it is no longer answered through the context trie either.
+    merged = []
+    removed = []
+    for key in list(model.responses):
+        if key is None:
+            continue
+
+        responses = model.responses[key]
+        if sum(r[1] for r in responses) < minKeyCount:
+            del model.responses[key]
+            merged.extend(responses)
+            removed.append(key)
+            continue
+
+        responses = pruneResponses(responses, minResponseCount, maxResponses)
+        if responses:
+            model.responses[key] = responses
+        else:
+            del model.responses[key]
+            removed.append(key)
+
+    if mergeRare and merged:
+        counts = {}
+        for response in model.responses.get(None, []) + merged:
+            counts[response[0]] = counts.get(response[0], 0) + response[1]
+        fallback = [[m2, count] for m2, count in counts.items()]
+        # the fallback must never be left empty, so it is only pruned when something survives
+        model.responses[None] = pruneResponses(fallback, minResponseCount, maxResponses) or fallback
+
+    contexts = getattr(model, "contexts", None)
+    if contexts is not None:
+        # the trie is keyed most recent turn first, so each root branch holds the contexts of one prompt key
+        if contexts.root[0]:
+            for key in removed:
+                contexts.root[0].pop(key, None)
+        stack = [contexts.root]
+        while stack:
+            node = stack.pop()
+            if node[1] and sum(r[1] for r in node[1]) < minKeyCount:
+                node[1] = None
+            elif node[1]:
+                node[1] = pruneResponses(node[1], minResponseCount, maxResponses) or None
+            if node[0]:
+                stack.extend(node[0].values())
+        contexts.compact()
+
+    return model
+
+def splitHeldOut(model, fileNames=None, holdout=HOLDOUT):
+    # Retrains model's configuration on all but the last holdout of each file's prompt/reply pairs. Returns the
+    # retrained model and the context keys and actual reply of every held-out pair.
+    size = model.getContextSize()
+    contexts = getattr(model, "contexts", None)
+    trained = Model(size, contexts.cutoff if contexts is not None else CUTOFF)
+    trained.responses[None] = [list(r) for r in model.responses.get(None, [])]
+    samples = []
+    for fileName in fileNames or _corpus.getTrainingFiles():
+        conversations = _corpus.readConversations(fileName)
+        total = sum(len(c) - 1 for c in conversations)
+        cut = total - int(total * holdout)
+        seen = 0
+        for conversation in conversations:
+            keys = [trained.getKey(m) for m in conversation[:-1]]
+            for i in range(1, len(conversation)):
+                context = keys[max(0, i - size):i]
+                if seen < cut:
+                    trained.trainKeys(context, conversation[i])
+                else:
+                    samples.append((context, conversation[i]))
+                seen += 1
+
+    trained.compact()
+    return trained, samples
+
+def measureCoverage(model, samples):
+    # (fraction of prompts matching a key or context, fraction whose actual reply is among the matched responses)
+    if not samples:
+        return 0.0, 0.0
+
+    matched = 0
+    known = 0
+    contexts = getattr(model, "contexts", None)
+    for keys, reply in samples:
+        responses = contexts.lookup(keys) if contexts is not None and len(keys) > 1 else None
+        if not responses:
+            responses = model.responses.get(keys[-1])
+        if responses:
+            matched += 1
+            if any(r[0] == reply for r in responses):
+                known += 1
+
+    return matched / len(samples), known / len(samples)
+
+def compare(model, trained, samples, **settings):
+    # Compacts a copy of model with settings and reports the memory it saves, and the coverage of the held-out samples
+    # lost by compacting trained, the model retrained without them, in the same way. Returns the compacted copy of model.
+    data = pickle.dumps(model, -1)
+    compacted = compactModel(pickle.loads(data), **settings)
+    after = pickle.dumps(compacted, -1)
+
+    beforeCoverage = measureCoverage(trained, samples)
+    afterCoverage = measureCoverage(compactModel(pickle.loads(pickle.dumps(trained, -1)), **settings), samples)
+    print("Settings:", ", ".join("%s=%s" % item for item in sorted(settings.items())) or "none")
+    print("Keys:       %d -> %d" % (len(model.responses), len(compacted.responses)))
+    print("Responses:  %d -> %d" % (sum(map(len, model.responses.values())),
+                                    sum(map(len, compacted.responses.values()))))
+    print("Size:       %d KiB -> %d KiB (%.1f%% saved)" % (len(data) // 1024, len(after) // 1024,
+                                                          100 * (1 - len(after) / len(data))))
+    print("Matched:    %.1f%% -> %.1f%% of %d held-out prompts" % (100 * beforeCoverage[0], 100 * afterCoverage[0],
+                                                                 len(samples)))
+    print("Reply kept: %.1f%% -> %.1f%%" % (100 * beforeCoverage[1], 100 * afterCoverage[1]))
+    if settings.get("mergeRare") and settings.get("maxResponses") is None:
+        print("Note: merging without a maximum number of responses moves the replies of rare keys into the None "
+              "fallback instead of dropping them, which saves little memory.")
+    return compacted
@@ -0,0 +1,205 @@
+#!/usr/bin/python
+# Version: 19 October 2026
+
+"""Corpus
+
+Compiles the plain text training files into binary shards of pre-extracted keys so that training does not decode,
+split and parse the same text on every run. A shard holds every distinct (context keys, reply) record of one training
+file with its number of occurrences, and is read back with mmap. Shards are rebuilt whenever the SHA-1 of their source
+file changes, when the parser which extracted the keys changes, or when a model needs more context than the shard was
+compiled with. The parser is fingerprinted by the source of its module and the installed rake-nltk and nltk versions.
+
+Shard layout, all integers little endian unsigned:
+
+    header      magic (4s), version (H), depth (H), source sha1 (20s), parser fingerprint (20s), string count (I),
+                record count (I)
+    offsets     string count + 1 (I) byte offsets into the string blob
+    strings     utf-8 text of every interned key and reply
+    records     record count records of count (I), reply id (I) and depth key ids (I), oldest key first. Contexts
+                shorter than depth are padded at the front with NO_KEY.
+
+Attributes:
+    ENCODING (str): The encoding of the training text files.
+    COMPILED_DIR (str): The folder in which the compiled shards are written.
+    NO_KEY (int): Key id used to pad contexts shorter than the shard's depth.
+"""
+
+import hashlib
+import importlib.metadata
+import mmap
+import os
+import struct
+import sys
+import unicodedata
+from collections import Counter
+
+ENCODING = "cp437"
+COMPILED_DIR = os.path.abspath(os.path.join(__file__, '../../../training/compiled'))
+NO_KEY = 0xFFFFFFFF
+
+MAGIC = b"NLPC"
+VERSION = 2
+HEADER = struct.Struct("<4sHH20s20sII")
+
+
+def normalize(text):
+    return unicodedata.normalize("NFC", text)
+
+def readConversations(fileName):
+    # Lists of consecutive lines, split on blank lines.
+    with open(fileName, "rb") as f:
+        return splitConversations(f.read())
+
+def splitConversations(data):
+    conversations = [[]]
+    for line in normalize(data.decode(ENCODING)).splitlines():
+        if not line or line.isspace():
+            conversations.append([])
+        else:
+            conversations[-1].append(line)
+
+    return [c for c in conversations if c]
+
+def getTrainingFiles():
+    # Every training text file, by folder, skipping the compiled shards.
+    training = os.path.dirname(COMPILED_DIR)
+    files = []
+    for folder in sorted(os.listdir(training)):
+        path = os.path.join(training, folder)
+        if path == COMPILED_DIR or not os.path.isdir(path):
+            continue
+        files.extend(os.path.join(path, name) for name in sorted(os.listdir(path)))
+
+    return files
+
+def getParserFingerprint(model):
+    # SHA-1 of the source of the module defining the model's parser and of the versions of the packages it relies on.
+    digest = hashlib.sha1()
+    with open(sys.modules[type(model.parser).__module__].__file__, "rb") as f:
+        digest.update(f.read())
+    for package in ("rake-nltk", "nltk"):
+        try:
+            version = importlib.metadata.version(package)
+        except importlib.metadata.PackageNotFoundError:
+            version = "unknown"
+        digest.update(("\0" + package + "=" + version).encode("utf-8"))
+
+    return digest.digest()
+
+def getShardPath(fileName):
+    folder, name = os.path.split(os.path.abspath(fileName))
+    return os.path.join(COMPILED_DIR, os.path.basename(folder) + "-" + name + ".shard")
+
+def compileCorpus(fileName, model, shardName=None):
+    # Extracts the keys of every prompt in fileName with the model's parser and writes them to a shard.
+    with open(fileName, "rb") as f:
+        data = f.read()
+
+    depth = model.getContextSize()
+    strings = {}
+    records = Counter()
+
+    def intern(s):
+        i = strings.get(s)
+        if i is None:
+            i = strings[s] = len(strings)
+        return i
+
+    for conversation in splitConversations(data):
+        keys = []
+        for last, line in zip(conversation, conversation[1:]):
+            keys.append(intern(model.getKey(last)))
+            del keys[:-depth]
+            records[(intern(line),) + (NO_KEY,) * (depth - len(keys)) + tuple(keys)] += 1
+
+    blob = [s.encode("utf-8") for s in strings]
+    offsets = [0]
+    for b in blob:
+        offsets.append(offsets[-1] + len(b))
+
+    shardName = shardName or getShardPath(fileName)
+    os.makedirs(os.path.dirname(shardName), exist_ok=True)
+    record = struct.Struct("<II%dI" % depth)
+    temp = shardName + ".tmp"
+    with open(temp, "wb") as out:
+        out.write(HEADER.pack(MAGIC, VERSION, depth, hashlib.sha1(data).digest(), getParserFingerprint(model),
+                              len(blob), len(records)))
+        out.write(struct.pack("<%dI" % len(offsets), *offsets))
+        out.writelines(blob)
+        for r, count in records.items():
+            out.write(record.pack(count, *r))
+    os.replace(temp, shardName)
+
+    return shardName
+
+def openCompiled(fileName, model):
+    # The shard of fileName, compiled first if it is missing or out of date.
+    shardName = getShardPath(fileName)
+    if os.path.exists(shardName):
+        with open(fileName, "rb") as f:
+            digest = hashlib.sha1(f.read()).digest()
+        try:
+            shard = Shard(shardName)
+        except (ValueError, struct.error):
+            shard = None
+        if shard is not None:
+            if shard.digest == digest and shard.parser == getParserFingerprint(model) \
+                    and shard.depth >= model.getContextSize():
+                return shard
+            shard.close()
+
+    return Shard(compileCorpus(fileName, model, shardName))
+
+
+class Shard:
+    def __init__(self, fileName):
+        self.fileName = fileName
+        with open(fileName, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.depth, self.digest, self.parser, self.stringCount, self.recordCount = \
+            HEADER.unpack_from(self.data)
+        if magic != MAGIC or version != VERSION:
+            self.data.close()
+            raise ValueError("not a compiled corpus shard: " + fileName)
+
+        self.offsetsStart = HEADER.size
+        self.stringsStart = self.offsetsStart + 4 * (self.stringCount + 1)
+        stringsSize = struct.unpack_from("<I", self.data, self.stringsStart - 4)[0]
+        self.recordsStart = self.stringsStart + stringsSize
+        self.record = struct.Struct("<II%dI" % self.depth)
+        self.strings = [None] * self.stringCount
+
+    def getString(self, i):
+        s = self.strings[i]
+        if s is None:
+            start, end = struct.unpack_from("<II", self.data, self.offsetsStart + 4 * i)
+            s = self.strings[i] = self.data[self.stringsStart + start:self.stringsStart + end].decode("utf-8")
+        return s
+
+    def records(self):
+        # (key ids oldest first, reply id, count) of each distinct record
+        end = self.recordsStart + self.record.size * self.recordCount
+        for offset in range(self.recordsStart, end, self.record.size):
+            r = self.record.unpack_from(self.data, offset)
+            yield tuple(k for k in r[2:] if k != NO_KEY), r[1], r[0]
+
+    def train(self, model):
+        for keys, reply, count in self.records():
+            model.trainKeys([self.getString(k) for k in keys], self.getString(reply), count)
+
+    def close(self):
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+if __name__ == "__main__":
+    import _model
+    model = _model.Model(_model.CONTEXT_SIZE)
+    for fileName in getTrainingFiles():
+        print("Compiled", compileCorpus(fileName, model))
@@ -6,44 +6,173 @@
 import pickle
 import random
 import os
+import sys
+import time
+import tracemalloc
 from _parser import Parser
+import _corpus
+
+# Number of conversation turns, including the prompt itself, used to key responses.
+CONTEXT_SIZE = 3
+# Contexts longer than one turn seen this many times or fewer are dropped by compact.
+CUTOFF = 2
+# Trie size at which training compacts the context index early, which bounds its memory during training.
+MAX_CONTEXT_NODES = 500000
+
+
+def addResponse(responses, m2, count=1):
+    for pair in responses:
+        if pair[0] == m2:
+            pair[1] += count
+            return
+
+    responses.append([m2, count])
+
+
+class ContextTrie:
+    # Maps the keys of the last few turns of a conversation to their responses. Keys are stored most recent first, so
+    # every node on the path to a context is one of its shorter contexts, which is what findResponse backs off to. Each
+    # node is a [children, responses] pair; single turn contexts live in Model.responses and are not duplicated here.
+    # Once the trie grows past maxNodes it is compacted during training. Counts of contexts pruned this early are lost,
+    # so maxNodes should be well above the size of the compacted trie; the limit doubles when a compaction frees little.
+    def __init__(self, depth, cutoff=CUTOFF, maxNodes=MAX_CONTEXT_NODES):
+        self.depth = depth
+        self.cutoff = cutoff
+        self.root = [{}, None]
+        self.maxNodes = maxNodes
+        self.limit = maxNodes
+        self.nodes = 1
+        self.peakNodes = 1
+
+    def add(self, keys, m2, count=1):
+        node = self.root
+        for i, key in enumerate(reversed(keys[-self.depth:])):
+            if node[0] is None:
+                node[0] = {}
+            child = node[0].get(key)
+            if child is None:
+                child = node[0][key] = [None, None]
+                self.nodes += 1
+            node = child
+
+            if i > 0:
+                if node[1] is None:
+                    node[1] = []
+                addResponse(node[1], m2, count)
+
+        self.peakNodes = max(self.peakNodes, self.nodes)
+        if self.maxNodes is not None and self.nodes > self.limit:
+            self.compact()
+            self.limit = max(self.maxNodes, 2 * self.nodes)
+
+    def lookup(self, keys):
+        node = self.root
+        best = None
+        for key in reversed(keys[-self.depth:]):
+            if node[0] is None:
+                break
+            node = node[0].get(key)
+            if node is None:
+                break
+            if node[1]:
+                best = node[1]
+
+        return best
+
+    def compact(self):
+        self.__compactNode(self.root)
+        self.nodes = self.size()[0]
+
+    def size(self):
+        # (nodes, stored responses), the two things that grow with depth
+        nodes = 0
+        responses = 0
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            nodes += 1
+            if node[1]:
+                responses += len(node[1])
+            if node[0]:
+                stack.extend(node[0].values())
+
+        return nodes, responses
+
+    def __compactNode(self, node):
+        if node[1] is not None and sum(r[1] for r in node[1]) <= self.cutoff:
+            node[1] = None
+
+        if node[0]:
+            for key in list(node[0]):
+                child = node[0][key]
+                self.__compactNode(child)
+                if child[0] is None and child[1] is None:
+                    del node[0][key]
+
+        if not node[0]:
+            node[0] = None
+
 
 class Model:
-    def __init__(self):
+    def __init__(self, contextSize=1, cutoff=CUTOFF, maxNodes=MAX_CONTEXT_NODES):
         self.parser = Parser()
         self.responses = {}
         self.huh = []
+        self.contexts = ContextTrie(contextSize, cutoff, maxNodes) if contextSize > 1 else None
 
-    def findResponse(self, m):
-        if (m != None):
-            key = self.parser.parse(m)
+    def getKey(self, m):
+        if m is None:
+            return None
 
-            if not key in self.responses:
-                key = None
-        else:
+        return self.parser.parse(m)
+
+    def getContextSize(self):
+        # models pickled before the context index existed have no contexts attribute
+        contexts = getattr(self, "contexts", None)
+        return contexts.depth if contexts is not None else 1
+
+    def getContextKeys(self, m, context=None):
+        keys = []
+        size = self.getContextSize()
+        if context and size > 1:
+            keys = [self.getKey(c) for c in context[-(size - 1):] if c is not None]
+
+        keys.append(self.getKey(m))
+        return keys
+
+    def findResponse(self, m, context=None):
+        return self.findResponseByKeys(self.getContextKeys(m, context))
+
+    def findResponseByKeys(self, keys):
+        key = keys[-1]
+        contexts = getattr(self, "contexts", None)
+        if contexts is not None and key is not None and len(keys) > 1:
+            responses = contexts.lookup(keys)
+            if responses:
+                return self.__chooseResponse(responses)
+
+        if not key in self.responses:
             key = None
-        
+
         return self.__chooseResponse(self.responses[key])
-    
-    def train(self, m1, m2):
-        if m1 != None:
-            key = self.parser.parse(m1)
-        else:
-            key = None
 
+    def train(self, m1, m2, context=None):
+        self.trainKeys(self.getContextKeys(m1, context), m2)
+
+    def trainKeys(self, keys, m2, count=1):
+        key = keys[-1]
         if key in self.responses:
-            responses = self.responses[key]
-            found = False
-            for pair in responses:
-                if pair[0] == m2:
-                    pair[1] += 1
-                    found = True
-                    break
-
-            if not found:
-                responses.append([m2, 1])
+            addResponse(self.responses[key], m2, count)
         else:
-            self.responses[key] = [[m2, 1]]
+            self.responses[key] = [[m2, count]]
+
+        contexts = getattr(self, "contexts", None)
+        if contexts is not None and key is not None and len(keys) > 1:
+            contexts.add(keys, m2, count)
+
+    def compact(self):
+        if self.contexts is not None:
+            self.contexts.compact()
 
     def __chooseResponse(self, possibleResponses):
         total = 0
@@ -92,37 +221,27 @@ def trainUnkown(model):
     model.train(None, "yeah")
 
 def trainFromFile(fileName, model):
-    f = open(fileName, "r", encoding="cp437")
-    last = None
-
-    for line in f:
-        if line.isspace():
-            line = None
-        else:
-            line = line[:-1]
-        
-        if (last is not None) and (line is not None):
-            model.train(last, line)
-        
-        last = line
-        
-    f.close()
+    # Keys are extracted once per version of the file and read back from its compiled shard afterwards.
+    with _corpus.openCompiled(fileName, model) as shard:
+        shard.train(model)
 
 def pickleModel(model):
     pickle.dump(model, open("model.p", "wb"))
 
-def unpickleModel():
+def unpickleModel(path="model.p"):
     # THIS_FOLDER = os.path.dirname(os.path.abspath(__file__))
     # my_file = os.path.join(THIS_FOLDER, 'model.p')
-    return pickle.load(open("model.p", "rb"))
+    with open(path, "rb") as f:
+        return pickle.load(f)
 
 def generate():
-    model = Model()
+    model = Model(CONTEXT_SIZE)
     model.__module__ = "_model"
     trainCornwell(model)
     trainCustom(model)
     trainNPS(model)
     trainUnkown(model)
+    model.compact()
 
     ##    print(model.findResponse(None))
     ##    print(model.findResponse("hi"))
@@ -130,6 +249,51 @@ def generate():
     pickleModel(model)
     return model
 
+def benchmarkContext(sizes=(1, 2, 3, 4), lookups=2000):
+    # Reports how the context index grows and how lookups slow down as the context size increases.
+    folder = os.path.abspath(os.path.join(__file__, '../../../training'))
+    conversations = []
+    for sub in ("custom", "nps-subset"):
+        for name in sorted(os.listdir(os.path.join(folder, sub))):
+            conversations.extend(_corpus.readConversations(os.path.join(folder, sub, name)))
+
+    for size in sizes:
+        model = Model(size)
+        tracemalloc.start()
+        trainCustom(model)
+        trainNPS(model)
+        trainUnkown(model)
+        trainingPeak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        model.compact()
+
+        # key extraction is the same for every size, so only the index itself is timed
+        samples = []
+        rand = random.Random(0)
+        while len(samples) < lookups:
+            c = rand.choice(conversations)
+            end = rand.randint(1, len(c))
+            samples.append([model.getKey(m) for m in c[max(0, end - size):end]])
+
+        times = []
+        for keys in samples:
+            start = time.perf_counter()
+            model.findResponseByKeys(keys)
+            times.append(time.perf_counter() - start)
+        times.sort()
+
+        nodes, responses = model.contexts.size() if model.contexts is not None else (0, 0)
+        peakNodes = model.contexts.peakNodes if model.contexts is not None else 0
+        print("context", size, "|",
+              "training peak", trainingPeak // 1024, "KiB |",
+              "pickle", len(pickle.dumps(model, -1)) // 1024, "KiB |",
+              "trie nodes", nodes, "(peak %d)" % peakNodes, "| trie responses", responses, "|",
+              "mean %.1f us" % (sum(times) / len(times) * 1e6), "|",
+              "p99 %.1f us" % (times[int(len(times) * 0.99)] * 1e6))
+
 
 if __name__ == "__main__":
-    generate()
+    if len(sys.argv) > 1 and sys.argv[1] == "benchmark":
+        benchmarkContext()
+    else:
+        generate()
@@ -0,0 +1,379 @@
+#!/usr/bin/python
+# Version: 19 October 2026
+
+"""Shard
+
+Splits a trained Model by key across several local model server processes, so that a model can outgrow the memory of
+a single process and its lookups can use more than one core. Every key, with its context trie branch, is owned by the
+shard crc32(key) % count selects; the None fallback responses are copied to every shard.
+
+Splitting is a separate offline step: writeShards pickles each shard to SHARD_DIR once, and openShards starts a process
+per shard file, so the process serving clients never loads the whole model. Each shard process loads only its own
+pickle, then writes its context size and peak memory next to its socket before it starts listening.
+
+Shards are served over Unix domain sockets. Each frame is a header of request id and payload length (both unsigned
+32-bit little endian) followed by a JSON payload. A request payload is a batch of context key lists and its response,
+sent back under the same id, is the list of chosen replies. Lookups submitted to a shard while its previous frame is
+being written are coalesced into the next frame, and clients do not wait for a response before sending the next frame,
+so any number of frames may be in flight on a connection.
+
+The chat server still extracts the keys itself and only the lookup runs on the shards. Lookups of the None key never
+leave the chat server, which keeps its own copy of the fallback responses. A shard which dies, or does not answer
+within SHARD_TIMEOUT, is restarted in the background, and the lookups it owns are answered with fallback responses
+until it is back.
+
+Attributes:
+    SHARD_DIR (str): The folder in which writeShards persists the shard pickles.
+    SHARD_TIMEOUT (float): The number of seconds a lookup waits for its shard before it is answered with a fallback
+        response and the shard is restarted.
+    START_TIMEOUT (float): The number of seconds a shard process may take to load its pickle and start listening.
+"""
+
+import json
+import multiprocessing
+import os
+import pickle
+import resource
+import shutil
+import socket
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from _model import Model
+
+SHARD_DIR = "shards"
+SHARD_TIMEOUT = 5.0
+START_TIMEOUT = 60.0
+FRAME = struct.Struct("<II")
+
+
+def shardIndex(key, count):
+    if key is None:
+        return 0
+    return zlib.crc32(key.encode("utf-8")) % count
+
+def splitModel(model, count):
+    size = model.getContextSize()
+    contexts = getattr(model, "contexts", None)
+    shards = [Model(size, contexts.cutoff if contexts is not None else 0) for _ in range(count)]
+
+    for key, responses in model.responses.items():
+        if key is None:
+            for shard in shards:
+                shard.responses[None] = responses
+        else:
+            shards[shardIndex(key, count)].responses[key] = responses
+
+    if contexts is not None and contexts.root[0]:
+        for key, node in contexts.root[0].items():
+            shards[shardIndex(key, count)].contexts.root[0][key] = node
+
+    return shards
+
+def getShardPaths(count, folder=SHARD_DIR):
+    return [os.path.join(folder, "model.shard%dof%d.p" % (i, count)) for i in range(count)]
+
+def writeShards(model, count, folder=SHARD_DIR):
+    # Pickles each shard of model to folder and returns their paths.
+    os.makedirs(folder, exist_ok=True)
+    paths = getShardPaths(count, folder)
+    for path, shard in zip(paths, splitModel(model, count)):
+        with open(path + ".tmp", "wb") as out:
+            pickle.dump(shard, out, -1)
+        os.replace(path + ".tmp", path)
+
+    return paths
+
+def recvExactly(conn, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise ConnectionResetError("shard connection closed")
+        data += chunk
+
+    return bytes(data)
+
+def sendFrame(conn, requestId, payload):
+    data = json.dumps(payload).encode("utf-8")
+    conn.sendall(FRAME.pack(requestId, len(data)) + data)
+
+def recvFrame(conn):
+    requestId, size = FRAME.unpack(recvExactly(conn, FRAME.size))
+    return requestId, json.loads(recvExactly(conn, size).decode("utf-8"))
+
+def serveShard(modelPath, socketPath):
+    # The main function of a shard process: answers lookups for the keys of the pickled shard until killed.
+    with open(modelPath, "rb") as f:
+        model = pickle.load(f)
+
+    # ru_maxrss is in KiB on Linux
+    with open(socketPath + ".info", "w") as out:
+        json.dump({"contextSize": model.getContextSize(),
+                   "fallback": model.responses.get(None, []),
+                   "maxrss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}, out)
+
+    # the socket only appears at socketPath once it is listening
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socketPath + ".tmp")
+    server.listen(16)
+    os.replace(socketPath + ".tmp", socketPath)
+
+    while 1:
+        conn, _ = server.accept()
+        threading.Thread(target=serveConnection, args=(model, conn), daemon=True).start()
+
+def serveConnection(model, conn):
+    try:
+        while 1:
+            requestId, batch = recvFrame(conn)
+            sendFrame(conn, requestId, [model.findResponseByKeys(keys) for keys in batch])
+    except (ConnectionResetError, OSError):
+        pass
+    finally:
+        conn.close()
+
+
+class ShardConnection:
+    # A pipelined connection to one shard. Lookups are queued by submit and a sender thread writes everything queued
+    # since its last frame as one batch, so concurrent lookups share frames. A reader thread resolves the futures of
+    # each batch as its response arrives.
+    def __init__(self, socketPath):
+        self.conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.conn.connect(socketPath)
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)
+        self.queue = []
+        self.pending = {}
+        self.nextId = 0
+        self.closed = False
+        self.frames = 0
+        self.lookups = 0
+        threading.Thread(target=self.__send, daemon=True).start()
+        threading.Thread(target=self.__read, daemon=True).start()
+
+    def submit(self, keys):
+        future = Future()
+        with self.lock:
+            if self.closed:
+                raise ConnectionResetError("shard connection closed")
+            self.queue.append((keys, future))
+            self.ready.notify()
+        return future
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.ready.notify()
+        self.conn.close()
+
+    def __send(self):
+        while 1:
+            with self.lock:
+                while not self.queue and not self.closed:
+                    self.ready.wait()
+                if self.closed:
+                    return
+                batch, self.queue = self.queue, []
+                requestId = self.nextId
+                self.nextId = (self.nextId + 1) & 0xFFFFFFFF
+                self.pending[requestId] = [future for _, future in batch]
+                self.frames += 1
+                self.lookups += len(batch)
+            try:
+                sendFrame(self.conn, requestId, [keys for keys, _ in batch])
+            except OSError as e:
+                self.__fail(e)
+                return
+
+    def __read(self):
+        try:
+            while 1:
+                requestId, responses = recvFrame(self.conn)
+                with self.lock:
+                    futures = self.pending.pop(requestId)
+                for future, response in zip(futures, responses):
+                    future.set_result(response)
+        except (ConnectionResetError, OSError) as e:
+            self.__fail(e)
+
+    def __fail(self, e):
+        with self.lock:
+            self.closed = True
+            futures = [f for batch in self.pending.values() for f in batch] + [f for _, f in self.queue]
+            self.pending.clear()
+            self.queue = []
+        for future in futures:
+            if not future.done():
+                future.set_exception(e)
+
+
+class ShardedModel:
+    # Stands in for a Model in the chat server, routing each lookup to the shard which owns its key. It also owns the
+    # shard processes and the folder of their sockets, which close cleans up. Shard failures never reach the caller:
+    # a lookup whose shard is down or too slow is answered from the local fallback responses and the shard restarted.
+    def __init__(self, modelPaths, socketPaths, processes, folder, contextSize, fallback):
+        self.local = Model(1)
+        self.local.responses[None] = fallback
+        self.parser = self.local.parser
+        self.contextSize = contextSize
+        self.modelPaths = modelPaths
+        self.socketPaths = socketPaths
+        self.shards = [ShardConnection(path) for path in socketPaths]
+        self.processes = list(processes)
+        self.folder = folder
+        self.lock = threading.Lock()
+        self.restarting = set()
+        self.restarts = 0
+        self.closed = False
+
+    def getKey(self, m):
+        if m is None:
+            return None
+
+        return self.parser.parse(m)
+
+    def getContextSize(self):
+        return self.contextSize
+
+    def getContextKeys(self, m, context=None):
+        return Model.getContextKeys(self, m, context)
+
+    def findResponse(self, m, context=None):
+        return self.findResponseByKeys(self.getContextKeys(m, context))
+
+    def findResponseByKeys(self, keys):
+        return self.findResponsesByKeys([keys])[0]
+
+    def findResponsesByKeys(self, batch):
+        # Every lookup is queued before any is awaited, so each shard receives its part of the batch in one frame.
+        count = len(self.shards)
+        lookups = [self.__submit(shardIndex(keys[-1], count), keys) if keys[-1] is not None else None
+                   for keys in batch]
+        deadline = time.monotonic() + SHARD_TIMEOUT
+        responses = []
+        for lookup in lookups:
+            if lookup is not None and lookup[2] is not None:
+                index, conn, future = lookup
+                try:
+                    responses.append(future.result(max(0.0, deadline - time.monotonic())))
+                    continue
+                except (FutureTimeoutError, ConnectionResetError, OSError):
+                    self.__restart(index, conn)
+            responses.append(self.local.findResponseByKeys([None]))
+        return responses
+
+    def getBatchStats(self):
+        # (frames sent, lookups sent) over all shards
+        return sum(s.frames for s in self.shards), sum(s.lookups for s in self.shards)
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+        for shard in self.shards:
+            shard.close()
+        stopShards(self.processes)
+        if self.folder is not None:
+            shutil.rmtree(self.folder, ignore_errors=True)
+
+    def __submit(self, index, keys):
+        conn = self.shards[index]
+        try:
+            return index, conn, conn.submit(keys)
+        except ConnectionResetError:
+            self.__restart(index, conn)
+            return index, conn, None
+
+    def __restart(self, index, conn):
+        # Replaces the shard behind the failed connection conn, unless it has already been replaced or is being.
+        with self.lock:
+            if self.closed or index in self.restarting or self.shards[index] is not conn:
+                return
+            self.restarting.add(index)
+            self.restarts += 1
+        print("Model shard", index, "failed, restarting it")
+        # closing fails the lookups still waiting on a hung shard, so they get fallback responses straight away
+        conn.close()
+        threading.Thread(target=self.__replace, args=(index,), daemon=True).start()
+
+    def __replace(self, index):
+        socketPath = self.socketPaths[index]
+        try:
+            stopShards([self.processes[index]])
+            for path in (socketPath, socketPath + ".info"):
+                if os.path.exists(path):
+                    os.remove(path)
+            process = startShardProcess(self.modelPaths[index], socketPath)
+            with self.lock:
+                self.processes[index] = process
+            waitForShards([socketPath], [process])
+            conn = ShardConnection(socketPath)
+            with self.lock:
+                if not self.closed:
+                    self.shards[index] = conn
+                    return
+            conn.close()
+            stopShards([process])
+        except (RuntimeError, OSError) as e:
+            # the shard stays down; the next lookup it owns tries again
+            print("Model shard", index, "could not be restarted:", repr(e))
+        finally:
+            with self.lock:
+                self.restarting.discard(index)
+
+
+def startShardProcess(modelPath, socketPath):
+    # spawned rather than forked, so that a shard never inherits the pages of the process starting it
+    process = multiprocessing.get_context("spawn").Process(target=serveShard, args=(modelPath, socketPath), daemon=True)
+    process.start()
+    return process
+
+def waitForShards(socketPaths, processes, timeout=START_TIMEOUT):
+    deadline = time.time() + timeout
+    while not all(os.path.exists(path) for path in socketPaths):
+        if time.time() > deadline or not all(p.is_alive() for p in processes):
+            raise RuntimeError("shard processes failed to start")
+        time.sleep(0.05)
+
+def startShards(modelPaths, timeout=START_TIMEOUT):
+    # Starts a process serving each pickled model in modelPaths, with their sockets in a temporary folder. Returns the
+    # connected ShardedModel and the peak memory, in KiB, of each shard process after loading its model.
+    folder = tempfile.mkdtemp(prefix="nlp-shards-")
+    socketPaths = [os.path.join(folder, "shard%d.sock" % i) for i in range(len(modelPaths))]
+    processes = [startShardProcess(path, socketPath) for path, socketPath in zip(modelPaths, socketPaths)]
+    try:
+        waitForShards(socketPaths, processes, timeout)
+    except RuntimeError:
+        stopShards(processes)
+        shutil.rmtree(folder, ignore_errors=True)
+        raise
+
+    info = []
+    for socketPath in socketPaths:
+        with open(socketPath + ".info") as f:
+            info.append(json.load(f))
+
+    sharded = ShardedModel(modelPaths, socketPaths, processes, folder, info[0]["contextSize"], info[0]["fallback"])
+    return sharded, [i["maxrss"] for i in info]
+
+def openShards(count, folder=SHARD_DIR):
+    # Serves the count shards which writeShards persisted to folder.
+    paths = getShardPaths(count, folder)
+    missing = [path for path in paths if not os.path.exists(path)]
+    if missing:
+        raise FileNotFoundError("missing model shard " + missing[0])
+
+    return startShards(paths)
+
+def stopShards(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        # a hung shard may not act on SIGTERM
+        process.join(1)
+        if process.is_alive():
+            process.kill()
+            process.join()